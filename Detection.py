@@ -0,0 +1,39 @@
+import math
+
+# Default model and the class names it was trained with
+MODEL_PATH = "Model/best.pt"
+CLASS_NAMES = ['Assault_weapon', 'Blunt-objects', 'Handguns', 'Knives', 'SMG', 'Shotgun'
+               ]
+
+# Desired display size, also the size of the frames CCTVApp records to frames/ and output_video.avi
+d_width = 1080
+d_height = 720
+
+# Header of detection_results.csv
+CSV_HEADER = ["Label", "X coordinate", "Y coordinate", "Confidence", "Time", "Frame Count"]
+
+
+def model_class_names(model):
+    # Class names stored in the model weights, ordered by class id
+    return [model.names[i] for i in sorted(model.names)]
+
+
+def detect(model, frame, class_names, verbose=True):
+    # Run YOLO on one frame and return a list of (label, x1, y1, x2, y2, confidence)
+    detections = []
+    results = model(frame, stream=True, imgsz=640, verbose=verbose)
+    for r in results:
+        for box in r.boxes:
+            # bounding box
+            x1, y1, x2, y2 = box.xyxy[0]
+            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)  # convert to int values
+
+            # confidence
+            confidence = math.ceil((box.conf[0] * 100)) / 100
+
+            # class name
+            cls = int(box.cls[0])
+            label = class_names[cls]
+
+            detections.append((label, x1, y1, x2, y2, confidence))
+    return detections
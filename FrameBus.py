@@ -0,0 +1,428 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+from multiprocessing import shared_memory
+import numpy as np
+import cv2
+
+# Header fields at the start of the shared memory block (all int64)
+H_WIDTH = 0
+H_HEIGHT = 1
+H_CHANNELS = 2
+H_SLOTS = 3
+H_LATEST_SEQ = 4  # Sequence number of the newest complete frame, 0 before the first one
+H_PRODUCER_HEARTBEAT = 5  # Milliseconds, updated by the producer on every frame
+H_CONSUMER_HEARTBEAT = 6  # Milliseconds, updated by consumers on every read
+H_RUNNING = 7
+HEADER_FIELDS = 8
+
+# Index block fields (all int64), the index points consumers at the ring of the current producer
+I_GENERATION = 0
+INDEX_FIELDS = 1
+
+# Seconds without a producer heartbeat before a bus is considered dead
+STALE_TIMEOUT = 5.0
+
+# Seconds without any consumer reading before the producer releases the camera
+IDLE_TIMEOUT = 10.0
+
+# Seconds to wait for a newly started producer, opening a camera on Windows can be slow
+OPEN_TIMEOUT = 30.0
+
+# Seconds of failed camera reads the producer rides out (e.g. a USB hiccup) before giving up.
+# It reopens the camera halfway through in case the driver dropped it.
+READ_FAILURE_TIMEOUT = 10.0
+
+
+def bus_name(camera_index):
+    # Fixed name of the index block, it holds the generation of the current ring
+    return f"framebus_cam{camera_index}"
+
+
+def ring_name(camera_index, generation):
+    # Every producer publishes into a ring of its own, so a consumer still mapping the ring of a
+    # producer that died never stops a new producer from creating its ring
+    return f"framebus_cam{camera_index}_g{generation}"
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def untrack(shm):
+    # Stop this process' resource tracker from unlinking the block when the process exits
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+
+def unlink_untracked(shm):
+    # unlink() also unregisters the block from the resource tracker, which complains about
+    # blocks it was never told about, so register it again first. Windows frees the block
+    # by itself once every handle is closed.
+    if os.name == 'nt':
+        return
+    if getattr(shm, "_track", True):
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.register(shm._name, "shared_memory")
+        except Exception:
+            pass
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def attach_memory(name):
+    # Attach without letting this process' resource tracker unlink the block when it exits
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        untrack(shm)
+        return shm
+
+
+class FrameRing:
+    # Numpy views over a shared memory block: header, per-slot sequence numbers and timestamps, frames
+    def __init__(self, shm, width=None, height=None, channels=None, slots=None):
+        self.shm = shm
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if width is not None:
+            self.header[:] = 0
+            self.header[H_WIDTH] = width
+            self.header[H_HEIGHT] = height
+            self.header[H_CHANNELS] = channels
+            self.header[H_SLOTS] = slots
+
+        self.width = int(self.header[H_WIDTH])
+        self.height = int(self.header[H_HEIGHT])
+        self.channels = int(self.header[H_CHANNELS])
+        self.slots = int(self.header[H_SLOTS])
+
+        offset = self.header.nbytes
+        self.slot_seq = np.ndarray((self.slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.slot_seq.nbytes
+        self.slot_time = np.ndarray((self.slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.slot_time.nbytes
+        self.frames = np.ndarray((self.slots, self.height, self.width, self.channels), dtype=np.uint8,
+                                 buffer=shm.buf, offset=offset)
+
+    @staticmethod
+    def size(width, height, channels, slots):
+        return 8 * HEADER_FIELDS + 16 * slots + slots * height * width * channels
+
+    def release(self):
+        # Drop the numpy views before closing, otherwise close() fails with exported buffers
+        self.header = self.slot_seq = self.slot_time = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A consumer still holds a zero-copy frame, the mapping goes away with it
+            pass
+
+
+class FrameBusProducer:
+    def __init__(self, camera_index, slots=8, idle_timeout=IDLE_TIMEOUT):
+        self.camera_index = camera_index
+        self.slots = slots
+        self.idle_timeout = idle_timeout
+        self.ring = None
+        self.shm = None
+        self.index = None
+        self.generation = 0
+
+    def open_index(self):
+        # Create the index block, or attach to the one a previous producer left behind
+        size = 8 * INDEX_FIELDS
+        try:
+            shm = shared_memory.SharedMemory(name=bus_name(self.camera_index), create=True, size=size)
+            np.ndarray((INDEX_FIELDS,), dtype=np.int64, buffer=shm.buf)[:] = 0
+            # The index outlives this producer if another one takes the bus over
+            untrack(shm)
+        except FileExistsError:
+            shm = attach_memory(bus_name(self.camera_index))
+        return shm
+
+    def create_ring(self, size):
+        # Take the next generation whose name is free, an old ring can outlive its producer while
+        # a consumer still maps it (on Windows the name stays taken until every handle is closed)
+        index = np.ndarray((INDEX_FIELDS,), dtype=np.int64, buffer=self.index.buf)
+        generation = int(index[I_GENERATION])
+        while True:
+            generation += 1
+            try:
+                shm = shared_memory.SharedMemory(name=ring_name(self.camera_index, generation),
+                                                 create=True, size=size)
+                break
+            except FileExistsError:
+                pass
+        self.generation = generation
+        return shm
+
+    def read(self, cap):
+        # Read a frame, retrying through transient failures while keeping the heartbeat fresh so
+        # consumers don't give up on the bus. Returns (cap, frame), frame is None once the camera is gone.
+        ret, frame = cap.read()
+        if ret:
+            return cap, frame
+        print(f"Frame bus: camera {self.camera_index} stopped delivering frames, retrying")
+        start = time.time()
+        reopened = False
+        while time.time() - start < READ_FAILURE_TIMEOUT:
+            if self.ring is not None:
+                self.ring.header[H_PRODUCER_HEARTBEAT] = now_ms()
+            time.sleep(0.1)
+            if not reopened and time.time() - start > READ_FAILURE_TIMEOUT / 2:
+                cap.release()
+                cap = cv2.VideoCapture(self.camera_index)
+                reopened = True
+            ret, frame = cap.read()
+            if ret:
+                print(f"Frame bus: camera {self.camera_index} is back")
+                return cap, frame
+        print(f"Frame bus: could not read from camera {self.camera_index}")
+        return cap, None
+
+    def run(self):
+        cap = cv2.VideoCapture(self.camera_index)
+        cap, frame = self.read(cap)
+        if frame is None:
+            cap.release()
+            return
+
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        name = bus_name(self.camera_index)
+        if bus_running(self.camera_index):
+            print(f"Frame bus: {name} is already running")
+            cap.release()
+            return
+        # Anything still in the index was left behind by a producer that crashed, take it over
+        self.index = self.open_index()
+        self.shm = self.create_ring(FrameRing.size(width, height, channels, self.slots))
+        self.ring = FrameRing(self.shm, width, height, channels, self.slots)
+        self.ring.header[H_CONSUMER_HEARTBEAT] = now_ms()
+        self.ring.header[H_RUNNING] = 1
+        index = np.ndarray((INDEX_FIELDS,), dtype=np.int64, buffer=self.index.buf)
+        index[I_GENERATION] = self.generation
+        print(f"Frame bus: publishing camera {self.camera_index} as "
+              f"{ring_name(self.camera_index, self.generation)} ({width}x{height})")
+
+        seq = 0
+        try:
+            while frame is not None:
+                seq += 1
+                self.publish(seq, frame)
+
+                # Release the camera once nobody has read a frame for a while
+                if now_ms() - self.ring.header[H_CONSUMER_HEARTBEAT] > self.idle_timeout * 1000:
+                    print(f"Frame bus: no consumers on {name}, stopping")
+                    break
+                # Another producer took the bus over after this one stalled, leave it the camera
+                if index[I_GENERATION] != self.generation:
+                    print(f"Frame bus: {name} was taken over, stopping")
+                    break
+                cap, frame = self.read(cap)
+        finally:
+            cap.release()
+            self.ring.header[H_RUNNING] = 0
+            self.ring.release()
+            self.shm.unlink()
+            # Remove the index only if no other producer has taken the bus over since
+            current = index[I_GENERATION] == self.generation
+            index = None
+            self.index.close()
+            if current:
+                unlink_untracked(self.index)
+
+    def publish(self, seq, frame):
+        ring = self.ring
+        i = seq % ring.slots
+        if frame.shape[:2] != (ring.height, ring.width):
+            frame = cv2.resize(frame, (ring.width, ring.height))
+
+        # Mark the slot as being written so readers never take a half-written frame
+        ring.slot_seq[i] = 0
+        ring.frames[i].reshape(frame.shape)[...] = frame
+        ring.slot_time[i] = now_ms()
+        ring.slot_seq[i] = seq
+        ring.header[H_LATEST_SEQ] = seq
+        ring.header[H_PRODUCER_HEARTBEAT] = now_ms()
+
+
+class FrameBusConsumer:
+    def __init__(self, camera_index):
+        # Raises FileNotFoundError if no producer is publishing the camera
+        index = attach_memory(bus_name(camera_index))
+        view = np.ndarray((INDEX_FIELDS,), dtype=np.int64, buffer=index.buf)
+        self.generation = int(view[I_GENERATION])
+        view = None
+        index.close()
+        self.shm = attach_memory(ring_name(camera_index, self.generation))
+        self.ring = FrameRing(self.shm)
+        self.last_seq = 0
+        self.dropped = 0  # Frames published but skipped because this consumer was slower
+
+    def alive(self):
+        ring = self.ring
+        return ring is not None and ring.header[H_RUNNING] == 1 and \
+            now_ms() - ring.header[H_PRODUCER_HEARTBEAT] < STALE_TIMEOUT * 1000
+
+    def latest(self):
+        # Return (seq, timestamp ms, frame view) for the newest frame, or None if nothing new.
+        # The view points straight into shared memory and stays valid until the producer
+        # wraps around the ring, check with is_current(seq) after using it.
+        ring = self.ring
+        ring.header[H_CONSUMER_HEARTBEAT] = now_ms()
+        seq = int(ring.header[H_LATEST_SEQ])
+        if seq == 0 or seq == self.last_seq:
+            return None
+        i = seq % ring.slots
+        if ring.slot_seq[i] != seq:
+            return None
+        if self.last_seq:
+            self.dropped += max(0, seq - self.last_seq - 1)
+        self.last_seq = seq
+        return seq, int(ring.slot_time[i]), ring.frames[i]
+
+    def is_current(self, seq):
+        return self.ring.slot_seq[seq % self.ring.slots] == seq
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.release()
+            self.ring = None
+
+
+def run_producer(camera_index, slots=8, idle_timeout=IDLE_TIMEOUT):
+    FrameBusProducer(camera_index, slots, idle_timeout).run()
+
+
+def bus_running(camera_index):
+    try:
+        consumer = FrameBusConsumer(camera_index)
+    except FileNotFoundError:
+        return False
+    alive = consumer.alive()
+    consumer.close()
+    return alive
+
+
+def launch_bus(camera_index):
+    # Start a producer process for the camera unless one is already publishing, without waiting for it.
+    # Separate process so the bus outlives whichever app started it.
+    if bus_running(camera_index):
+        return None
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), "--camera", str(camera_index)])
+
+
+class BusCapture:
+    # Drop-in replacement for cv2.VideoCapture that reads from the frame bus.
+    # Opening never blocks: poll isOpened() and failed() until one of them is true.
+    # If the producer dies, isOpened() moves over to whichever producer publishes the camera next,
+    # and returns False (with failed() True) when there is none.
+    def __init__(self, camera_index, timeout=OPEN_TIMEOUT):
+        self.camera_index = camera_index
+        self.consumer = None
+        self.dropped = 0  # Frames skipped on the rings of earlier producers
+        self.process = launch_bus(camera_index)
+        self.deadline = time.time() + timeout
+
+    def attach(self):
+        # The producer can exit between checking the bus and attaching to it
+        try:
+            consumer = FrameBusConsumer(self.camera_index)
+        except FileNotFoundError:
+            return False
+        if not consumer.alive():
+            consumer.close()
+            return False
+        self.consumer = consumer
+        return True
+
+    def detach(self):
+        # Let go of the ring of a producer that is gone, so its memory can be freed
+        self.dropped += self.consumer.dropped
+        self.consumer.close()
+        self.consumer = None
+
+    def isOpened(self):
+        if self.consumer is not None and not self.consumer.alive():
+            self.detach()
+            if not self.attach():
+                print(f"Frame bus: camera {self.camera_index} is no longer being published")
+                self.deadline = None
+                return False
+            print(f"Frame bus: reattached to camera {self.camera_index}")
+        if self.consumer is None:
+            if self.deadline is None or not self.attach():
+                return False
+        return True
+
+    def failed(self):
+        # True once the camera can't come up any more: the producer exited or took too long
+        if self.consumer is not None:
+            return not self.isOpened()
+        if self.deadline is None:
+            return True
+        if self.process is not None and self.process.poll() is not None:
+            # It may have exited because another app's producer won the race for the camera
+            return not bus_running(self.camera_index)
+        if time.time() > self.deadline:
+            # Don't leave a producer we started publishing a camera nobody is waiting for
+            if self.process is not None and self.process.poll() is None:
+                self.process.terminate()
+            self.deadline = None
+            return True
+        return False
+
+    def frames_dropped(self):
+        # Frames the camera delivered that this app never read because it was slower
+        return self.dropped + (self.consumer.dropped if self.consumer is not None else 0)
+
+    def read(self, copy=True):
+        # Unlike cv2.VideoCapture this never blocks, (False, None) means no new frame yet.
+        # With copy=False the frame is a read-only view into shared memory, so callers
+        # that draw on it must copy it first, and must check is_current() once they have
+        # finished reading it.
+        if self.consumer is None:
+            return False, None
+        latest = self.consumer.latest()
+        if latest is None:
+            return False, None
+        seq, timestamp, frame = latest
+        if not copy:
+            frame = frame.view()
+            frame.flags.writeable = False
+            return True, frame
+        frame = frame.copy()
+        if not self.consumer.is_current(seq):
+            # The producer wrapped around while copying, the copy may be torn
+            return False, None
+        return True, frame
+
+    def is_current(self):
+        # False if the producer has overwritten the slot of the last frame returned by read()
+        return self.consumer is not None and self.consumer.is_current(self.consumer.last_seq)
+
+    def release(self):
+        if self.consumer is not None:
+            self.detach()
+        self.deadline = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture a camera once and share its frames with local consumers")
+    parser.add_argument("--camera", type=int, default=0, help="Camera index")
+    parser.add_argument("--slots", type=int, default=8, help="Number of ring slots")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="Seconds without consumers before the camera is released")
+    args = parser.parse_args()
+
+    run_producer(args.camera, args.slots, args.idle_timeout)
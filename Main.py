@@ -1,18 +1,16 @@
 import tkinter as tk
-from tkinter import Label, Button, Frame, ttk
+from tkinter import Label, Button, Frame, ttk, filedialog
 import cv2
 from PIL import Image, ImageTk
 import datetime
 import os
 import csv
-from ultralytics import YOLO
-import math
 import serial
 import serial.tools.list_ports
-
-# Desired display size
-d_width = 1080
-d_height = 720
+from Retention import RetentionManager, load_config
+from Detection import MODEL_PATH, CLASS_NAMES, CSV_HEADER, d_width, d_height, detect
+from FrameBus import BusCapture, bus_running
+from ModelManager import ModelManager
 
 class CCTVApp:
     def __init__(self, root):
@@ -97,6 +95,22 @@ class CCTVApp:
         self.test_mode_button = Button(self.mode_button_frame, text="Test mode", command=self.test_mode)
         self.test_mode_button.pack(side="left", padx=5)
 
+        # Create another frame to hold the model buttons
+        self.model_button_frame = tk.Frame(self.right_frame)
+        self.model_button_frame.pack(pady=10)
+
+        # Create a button to hot-swap the detection model
+        self.load_model_button = Button(self.model_button_frame, text="Load Model", command=self.load_model)
+        self.load_model_button.pack(side="left", padx=5)
+
+        # Create a button to start/stop shadow evaluation of a candidate model
+        self.shadow_button = Button(self.model_button_frame, text="Shadow Model", command=self.toggle_shadow)
+        self.shadow_button.pack(side="left", padx=5)
+
+        # Create a label to show the active model and shadow results
+        self.model_label = Label(self.right_frame, text="", justify="left")
+        self.model_label.pack(pady=5)
+
         # Create a frame to hold the data display
         self.data_frame = Frame(self.right_frame)
         self.data_frame.pack(fill='both', expand=True, pady=(10, 0))
@@ -125,18 +139,27 @@ class CCTVApp:
         self.data_here_label = Label(self.right_frame, text="Data here")
         self.data_here_label.pack(pady=10)
 
+        # Add a label showing disk usage and how long the disk will last
+        self.storage_label = Label(self.right_frame, text="Disk: checking...", justify="left")
+        self.storage_label.pack(pady=5)
+
         # Video capture control variables
         self.cap = None
         self.running = False
 
-        # Initialize YOLO model
-        self.model = YOLO("Model/best.pt")
-        self.classNames = ['Assault_weapon', 'Blunt-objects', 'Handguns', 'Knives', 'SMG', 'Shotgun'
-                          ]
+        # Initialize YOLO model, later models are swapped in without restarting
+        self.models = ModelManager(MODEL_PATH, CLASS_NAMES)
 
         # Prepare for result saving
         self.prepare_results_folder()
 
+        # Start the background retention service for old run folders, policy from retention_config.json
+        self.retention = RetentionManager(self.result_folder_path, **load_config(self.result_folder_path))
+        self.retention.active_run_folder = self.run_folder
+        self.retention.start()
+        self.update_storage_label()
+        self.update_model_label()
+
         # Serial port control variables
         self.serial_inst = serial.Serial()
         self.selected_port = None
@@ -154,9 +177,43 @@ class CCTVApp:
     def exit_maximize(self, event=None):
         self.root.state('normal')
 
+    def update_storage_label(self):
+        text = self.retention.status_text()
+        if self.frames_not_saved:
+            text += f"\nFrames not saved: {self.frames_not_saved}"
+        if self.cap is not None and self.cap.frames_dropped():
+            # Camera frames the detection loop was too slow to take, they are missing from the recording
+            text += f"\nFrames skipped: {self.cap.frames_dropped()}"
+        self.storage_label.config(text=text)
+        self.root.after(5000, self.update_storage_label)
+
+    def update_model_label(self):
+        self.models.poll_shadow()
+        self.model_label.config(text=self.models.status_text())
+        self.shadow_button.config(text="Stop Shadow" if self.models.shadow_process is not None else "Shadow Model")
+        self.root.after(1000, self.update_model_label)
+
+    def load_model(self):
+        model_path = filedialog.askopenfilename(title="Select a Model", filetypes=[("YOLO Model", "*.pt")])
+        if model_path:
+            self.models.load(model_path)
+
+    def toggle_shadow(self):
+        if self.models.shadow_process is not None:
+            self.models.stop_shadow()
+            return
+        model_path = filedialog.askopenfilename(title="Select a Candidate Model", filetypes=[("YOLO Model", "*.pt")])
+        if model_path:
+            shadow_csv_path = os.path.join(self.run_folder, "shadow_results.csv")
+            self.models.start_shadow(model_path, sample_rate=0.1, csv_path=shadow_csv_path)
+
     def enumerate_cameras(self):
         available = []
         for i in range(5):  # Try up to 5 indices for simplicity
+            # A camera already published on the frame bus can't be opened directly
+            if bus_running(i):
+                available.append(i)
+                continue
             cap = cv2.VideoCapture(i)
             if cap.read()[0]:
                 available.append(i)
@@ -189,11 +246,24 @@ class CCTVApp:
 
     def start_camera(self):
         selected_camera = int(self.camera_var.get())
-        self.cap = cv2.VideoCapture(selected_camera)  # Open the selected camera
-        self.running = True
-        self.start_button.config(text="Stop Camera")
-        self.message_label.config(text="Video display here")
-        self.video_loop()
+        self.cap = BusCapture(selected_camera)  # Attach to the selected camera through the frame bus
+        self.start_button.config(text="Starting...", state="disabled")
+        self.wait_for_camera(selected_camera)
+
+    def wait_for_camera(self, selected_camera):
+        # Poll without blocking the UI until the frame bus is publishing the camera
+        if self.cap.isOpened():
+            self.running = True
+            self.start_button.config(text="Stop Camera", state="normal")
+            self.message_label.config(text="Video display here")
+            self.video_loop()
+        elif self.cap.failed():
+            print(f"Error opening camera {selected_camera}")
+            self.cap.release()
+            self.cap = None
+            self.start_button.config(text="Start Camera", state="normal")
+        else:
+            self.root.after(100, self.wait_for_camera, selected_camera)
 
     def stop_camera(self):
         self.running = False
@@ -221,63 +291,57 @@ class CCTVApp:
         if self.running and self.cap.isOpened():
             ret, frame = self.cap.read()
             if ret:
-                # Perform YOLO detection
-                results = self.model(frame, stream=True, imgsz=640)
-
-                for r in results:
-                    boxes = r.boxes
-                    for box in boxes:
-                        # bounding box
-                        x1, y1, x2, y2 = box.xyxy[0]
-                        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)  # convert to int values
-                        w = x2 - x1
-                        h = y2 - y1
-                        # put box in frame
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 255), 3)
-
-                        # confidence
-                        confidence = math.ceil((box.conf[0] * 100)) / 100
-
-                        # class name
-                        cls = int(box.cls[0])
-                        label = self.classNames[cls]
-
-                        # put label on frame
-                        cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 0, 0), 2)
-                        #
-                        # Increment the detected number
-                        self.detected_number += 1
-                        if self.detected_number > 3 and self.text_system_gate == 0 and self.text_system_active:
-                            self.serial_inst.flushInput()
-                            self.serial_inst.write(label.encode())  # Convert label to bytes
-                            print("Message sent to the Arduino.")
-                            self.text_system_gate = 1
-
-                        # Log the object details to CSV
-                        with open(self.csv_file_path, 'a', newline='') as csvfile:
-                            csv_writer = csv.writer(csvfile)
-                            if self.header == 0:
-                                csv_writer.writerow(["Label", "X coordinate", "Y coordinate", "Confidence", "Time", "Frame Count"])
-                                self.header = 1
-
-                            # Scrollable list display
-                            current_time = datetime.datetime.now().strftime("%H:%M:%S")
-                            current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-                            data_type = label
-                            accuracy = confidence
-                            test_data = f"Time: {current_time}, Date: {current_date}, Type: {data_type}, Accuracy: {accuracy}"
-
-                            # Create a label for the new data and add it to the scrollable frame
-                            data_label = Label(self.scrollable_frame, text=test_data, anchor="w", justify="left")
-                            data_label.pack(fill="x", padx=10, pady=2)
-                            csv_writer.writerow([label, x1, y1, confidence, current_time, self.frame_count])
+                # Perform YOLO detection, taking the model once so a swap only applies from the next frame
+                model, class_names, model_path = self.models.active
+                detections = detect(model, frame, class_names)
+
+                # Hand a sample of frames to the shadow model before anything is drawn on them
+                self.models.submit_shadow(frame, detections, self.frame_count)
+
+                for label, x1, y1, x2, y2, confidence in detections:
+                    # put box in frame
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 255), 3)
+
+                    # put label on frame
+                    cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 0, 0), 2)
+                    #
+                    # Increment the detected number
+                    self.detected_number += 1
+                    if self.detected_number > 3 and self.text_system_gate == 0 and self.text_system_active:
+                        self.serial_inst.flushInput()
+                        self.serial_inst.write(label.encode())  # Convert label to bytes
+                        print("Message sent to the Arduino.")
+                        self.text_system_gate = 1
+
+                    # Log the object details to CSV
+                    with open(self.csv_file_path, 'a', newline='') as csvfile:
+                        csv_writer = csv.writer(csvfile)
+                        if self.header == 0:
+                            csv_writer.writerow(CSV_HEADER)
+                            self.header = 1
+
+                        # Scrollable list display
+                        current_time = datetime.datetime.now().strftime("%H:%M:%S")
+                        current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+                        data_type = label
+                        accuracy = confidence
+                        test_data = f"Time: {current_time}, Date: {current_date}, Type: {data_type}, Accuracy: {accuracy}"
+
+                        # Create a label for the new data and add it to the scrollable frame
+                        data_label = Label(self.scrollable_frame, text=test_data, anchor="w", justify="left")
+                        data_label.pack(fill="x", padx=10, pady=2)
+                        csv_writer.writerow([label, x1, y1, confidence, current_time, self.frame_count])
 
                 # Resize the frame to the desired display size
                 frame = cv2.resize(frame, (d_width, d_height))
 
                 # Save the frame to the disk
                 frame_path = os.path.join(self.pics_folder_path, f"frame_{self.frame_count}.jpg")
-                cv2.imwrite(frame_path, frame)
+                if not cv2.imwrite(frame_path, frame):
+                    # Only print the first failure, the running count is shown in the storage label
+                    if self.frames_not_saved == 0:
+                        print(f"Error saving frame to {frame_path}, disk may be full")
+                    self.frames_not_saved += 1
 
                 # Write the frame to the video file
                 self.video_writer.write(frame)
@@ -295,17 +359,22 @@ class CCTVApp:
 
             # Call this method again after 10 ms
             self.root.after(10, self.video_loop)
+        elif self.running:
+            # The frame bus producer is gone and no other one took over, reset the UI
+            print("Camera disconnected")
+            self.stop_camera()
+            self.message_label.config(text="Camera disconnected")
 
     def prepare_results_folder(self):
         # Create a folder to save the results if it doesn't exist
         home_dir = os.path.expanduser("~")
         documents_dir = os.path.join(home_dir, "Documents")
-        result_folder_path = os.path.join(documents_dir, 'results_Yolov8')
-        os.makedirs(result_folder_path, exist_ok=True)
+        self.result_folder_path = os.path.join(documents_dir, 'results_Yolov8')
+        os.makedirs(self.result_folder_path, exist_ok=True)
 
         # Create a sub-folder for the current run
         timestamp = datetime.datetime.now().strftime("%b_%d_%Y_%H_%M_%S")
-        self.run_folder = os.path.join(result_folder_path, timestamp)
+        self.run_folder = os.path.join(self.result_folder_path, timestamp)
         os.makedirs(self.run_folder, exist_ok=True)
 
         # Path for CSV and pictures
@@ -316,6 +385,7 @@ class CCTVApp:
         # Initialize header flag and frame count
         self.header = 0
         self.frame_count = 0
+        self.frames_not_saved = 0
 
         # Initialize VideoWriter
         video_path = os.path.join(self.run_folder, "output_video.avi")
@@ -323,6 +393,10 @@ class CCTVApp:
         self.video_writer = cv2.VideoWriter(video_path, fourcc, 20.0, (d_width, d_height))
 
     def __del__(self):
+        if hasattr(self, 'retention'):
+            self.retention.stop()
+        if hasattr(self, 'models'):
+            self.models.stop_shadow()
         if self.cap and self.cap.isOpened():
             self.cap.release()
         if self.serial_inst.is_open:
@@ -330,7 +404,8 @@ class CCTVApp:
         if hasattr(self, 'video_writer') and self.video_writer.isOpened():
             self.video_writer.release()
 
-# Create the main window
-root = tk.Tk()
-app = CCTVApp(root)
-root.mainloop()
+# Create the main window, guarded because the shadow model process re-imports this module on Windows
+if __name__ == "__main__":
+    root = tk.Tk()
+    app = CCTVApp(root)
+    root.mainloop()
@@ -0,0 +1,266 @@
+import os
+import csv
+import time
+import queue
+import ctypes
+import random
+import threading
+import multiprocessing
+import numpy as np
+from ultralytics import YOLO
+from Detection import detect, model_class_names
+
+# IoU needed for a shadow box to count as the same detection as a production box
+MATCH_IOU = 0.5
+
+# Windows SetPriorityClass value for the shadow process
+BELOW_NORMAL_PRIORITY_CLASS = 0x00004000
+
+
+def load_model(model_path, class_names=None):
+    # Load a model and run it once on a blank frame so the first live frame isn't slow
+    model = YOLO(model_path)
+    model(np.zeros((640, 640, 3), dtype=np.uint8), imgsz=640, verbose=False)
+    if class_names is None:
+        class_names = model_class_names(model)
+    return model, class_names
+
+
+def iou(a, b):
+    # a and b are (x1, y1, x2, y2)
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_detections(production, shadow):
+    # Greedily pair boxes with the same label, return the number of matched pairs
+    unmatched = list(shadow)
+    matched = 0
+    for label, x1, y1, x2, y2, confidence in production:
+        best, best_iou = None, MATCH_IOU
+        for candidate in unmatched:
+            if candidate[0] != label:
+                continue
+            overlap = iou((x1, y1, x2, y2), candidate[1:5])
+            if overlap >= best_iou:
+                best, best_iou = candidate, overlap
+        if best is not None:
+            unmatched.remove(best)
+            matched += 1
+    return matched
+
+
+def lower_process_priority():
+    # Keep the shadow process from taking CPU away from the live video loop
+    if os.name == 'nt':
+        try:
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), BELOW_NORMAL_PRIORITY_CLASS)
+        except (AttributeError, OSError):
+            pass
+    else:
+        try:
+            os.nice(10)
+        except OSError:
+            pass
+
+
+def log_shadow(csv_path, frame_count, production_ms, shadow_ms, production_boxes, shadow_boxes, matched):
+    write_header = not os.path.exists(csv_path)
+    with open(csv_path, 'a', newline='') as csvfile:
+        csv_writer = csv.writer(csvfile)
+        if write_header:
+            csv_writer.writerow(["Frame Count", "Production ms", "Shadow ms",
+                                 "Production Detections", "Shadow Detections", "Matched"])
+        csv_writer.writerow([frame_count, f"{production_ms:.1f}", f"{shadow_ms:.1f}",
+                             production_boxes, shadow_boxes, matched])
+
+
+def shadow_worker(model_path, class_names, production_path, production_names, csv_path, frame_queue, result_queue):
+    # Runs in the shadow process: one inference thread at low priority, results go back over result_queue.
+    # The production model is timed here too, under the same throttling, so the two latencies compare
+    # the models rather than the throttled process with the live loop.
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    lower_process_priority()
+
+    try:
+        model, class_names = load_model(model_path, class_names)
+        production_model, production_names = load_model(production_path, production_names)
+    except Exception as e:
+        result_queue.put(("error", str(e)))
+        return
+    result_queue.put(("ready",))
+
+    while True:
+        item = frame_queue.get()
+        if item is None:
+            return
+        frame, production, frame_count = item
+
+        start = time.perf_counter()
+        detect(production_model, frame, production_names, verbose=False)
+        production_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        shadow = detect(model, frame, class_names, verbose=False)
+        shadow_ms = (time.perf_counter() - start) * 1000
+        matched = match_detections(production, shadow)
+
+        result_queue.put(("result", production_ms, shadow_ms, len(production), len(shadow), matched))
+        if csv_path:
+            log_shadow(csv_path, frame_count, production_ms, shadow_ms, len(production), len(shadow), matched)
+
+
+class ModelManager:
+    def __init__(self, model_path, class_names):
+        # (model, class names, path) replaced in a single assignment, so a frame always sees one
+        # consistent model even while a new one is being swapped in
+        self.active = (YOLO(model_path), class_names, model_path)
+        self.loading = None  # Path of the model being loaded in the background
+
+        # Shadow evaluation, in its own process so it never competes with the live loop for the GIL
+        self.shadow_process = None
+        self.shadow_frames = None  # Holds at most one frame, anything more is dropped
+        self.shadow_results = None
+        self.shadow_path = None
+        self.shadow_production_path = None  # Production model the shadow is timed against
+        self.shadow_ready = False
+        self.shadow_rate = 0.0
+        self.reset_shadow_stats()
+
+    def load(self, model_path, class_names=None):
+        # Load and warm up a new production model without blocking the video loop
+        if self.loading:
+            print(f"Already loading {self.loading}")
+            return
+        self.loading = model_path
+        threading.Thread(target=self.load_worker, args=(model_path, class_names), daemon=True).start()
+
+    def load_worker(self, model_path, class_names):
+        try:
+            model, class_names = load_model(model_path, class_names)
+            self.active = (model, class_names, model_path)
+            print(f"Switched to model {model_path}")
+        except Exception as e:
+            print(f"Error loading model {model_path}: {e}")
+        finally:
+            self.loading = None
+
+    def reset_shadow_stats(self):
+        self.shadow_stats = {
+            "frames": 0,
+            "production_ms": 0.0,
+            "shadow_ms": 0.0,
+            "production_boxes": 0,
+            "shadow_boxes": 0,
+            "matched": 0,
+        }
+
+    def start_shadow(self, model_path, sample_rate=0.1, csv_path=None, class_names=None):
+        # Run a candidate model on a sample of live frames and compare it with production
+        self.stop_shadow()
+        _, production_names, production_path = self.active
+        self.shadow_rate = sample_rate
+        self.shadow_path = model_path
+        self.shadow_production_path = production_path
+        self.shadow_ready = False
+        self.reset_shadow_stats()
+        # Spawn on every platform, forking a process that holds torch and Tk state isn't safe
+        context = multiprocessing.get_context("spawn")
+        self.shadow_frames = context.Queue(maxsize=1)
+        self.shadow_results = context.Queue()
+        self.shadow_process = context.Process(
+            target=shadow_worker,
+            args=(model_path, class_names, production_path, production_names, csv_path,
+                  self.shadow_frames, self.shadow_results),
+            daemon=True)
+        self.shadow_process.start()
+
+    def stop_shadow(self):
+        self.shadow_ready = False
+        self.shadow_rate = 0.0
+        if self.shadow_process is not None:
+            # Replace any waiting frame with the stop signal, so the worker finishes its CSV line and exits
+            try:
+                self.shadow_frames.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.shadow_frames.put_nowait(None)
+            except queue.Full:
+                self.shadow_process.terminate()
+            self.shadow_process = None
+            self.shadow_frames = None
+            self.shadow_results = None
+
+    def submit_shadow(self, frame, detections, frame_count):
+        # Called from the video loop, never blocks: the frame is dropped if the shadow is still busy
+        if not self.shadow_ready or random.random() >= self.shadow_rate:
+            return
+        try:
+            # Copied because the queue pickles in a background thread and the caller draws on the frame
+            self.shadow_frames.put_nowait((frame.copy(), detections, frame_count))
+        except queue.Full:
+            pass
+
+    def poll_shadow(self):
+        # Collect results sent back by the shadow process, called periodically from the UI
+        if self.shadow_process is None:
+            return
+        while True:
+            try:
+                message = self.shadow_results.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == "ready":
+                self.shadow_ready = True
+                print(f"Shadow model {self.shadow_path} running on {self.shadow_rate:.0%} of frames")
+            elif message[0] == "error":
+                print(f"Error loading shadow model {self.shadow_path}: {message[1]}")
+                self.stop_shadow()
+                return
+            else:
+                production_ms, shadow_ms, production_boxes, shadow_boxes, matched = message[1:]
+                stats = self.shadow_stats
+                stats["frames"] += 1
+                stats["production_ms"] += production_ms
+                stats["shadow_ms"] += shadow_ms
+                stats["production_boxes"] += production_boxes
+                stats["shadow_boxes"] += shadow_boxes
+                stats["matched"] += matched
+
+        # A crash (e.g. out of memory) sends no error message, don't show it as loading forever
+        if not self.shadow_process.is_alive():
+            print(f"Shadow model {self.shadow_path} stopped unexpectedly "
+                  f"(exit code {self.shadow_process.exitcode})")
+            self.stop_shadow()
+
+    def status_text(self):
+        model_path = self.active[2]
+        text = f"Model: {os.path.basename(model_path)}"
+        if self.loading:
+            text += f"\nLoading: {os.path.basename(self.loading)}"
+        if self.shadow_process is not None:
+            if not self.shadow_ready:
+                text += "\nShadow: loading..."
+            else:
+                stats = self.shadow_stats
+                text += f"\nShadow: {os.path.basename(self.shadow_path)}, {stats['frames']} frames"
+                if stats["frames"]:
+                    # Agreement: matched boxes over all distinct boxes seen by either model
+                    total = stats["production_boxes"] + stats["shadow_boxes"] - stats["matched"]
+                    agreement = stats["matched"] / total if total else 1.0
+                    # Both timed in the throttled shadow process (one thread, low priority), so they
+                    # are only comparable with each other, not with the live frame rate
+                    text += (f"\nLatency (throttled): {stats['production_ms'] / stats['frames']:.0f} ms "
+                             f"{os.path.basename(self.shadow_production_path)}, "
+                             f"{stats['shadow_ms'] / stats['frames']:.0f} ms shadow"
+                             f"\nAgreement: {agreement:.0%}")
+        return text
@@ -4,6 +4,7 @@ import cv2
 from PIL import Image, ImageTk
 import numpy as np
 import colorsys
+from FrameBus import BusCapture, bus_running
 
 class CameraApp:
     def __init__(self, root):
@@ -66,6 +67,10 @@ class CameraApp:
         # Detect available cameras
         camera_list = []
         for i in range(10):
+            # A camera already published on the frame bus can't be opened directly
+            if bus_running(i):
+                camera_list.append(f"Camera {i}")
+                continue
             cap = cv2.VideoCapture(i)
             if cap.isOpened():
                 camera_list.append(f"Camera {i}")
@@ -74,26 +79,47 @@ class CameraApp:
 
     def start_camera(self):
         if not self.running:
-            self.running = True
             self.start_button.config(state="disabled")
             self.upload_button.config(state="disabled")
-            self.stop_button.config(state="normal")
 
             camera_index = self.camera_list.current()
-            self.cap = cv2.VideoCapture(camera_index)
+            self.cap = BusCapture(camera_index)  # Shared with the detector through the frame bus
+            self.wait_for_camera(camera_index)
+
+    def wait_for_camera(self, camera_index):
+        # Poll without blocking the UI until the frame bus is publishing the camera
+        if self.cap.isOpened():
+            self.running = True
+            self.stop_button.config(state="normal")
             self.show_frame()
+        elif self.cap.failed():
+            print(f"Error opening camera {camera_index}")
+            self.cap.release()
+            self.cap = None
+            self.start_button.config(state="normal")
+            self.upload_button.config(state="normal")
+        else:
+            self.root.after(100, self.wait_for_camera, camera_index)
 
     def show_frame(self):
+        if self.running and not self.cap.isOpened():
+            # The frame bus producer is gone and no other one took over, reset the UI
+            print("Camera disconnected")
+            self.stop_camera()
         if self.running:
-            ret, frame = self.cap.read()
+            # Zero-copy view, cvtColor below makes our own copy
+            ret, frame = self.cap.read(copy=False)
+            if ret:
+                # Convert the frame to RGB (OpenCV uses BGR by default)
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+                # Skip the frame if the producer overwrote it while it was being converted
+                ret = self.cap.is_current()
             if ret:
                 # Resize the frame to fit the window size
                 window_width = self.video_frame.winfo_width()
                 window_height = self.video_frame.winfo_height()
 
-                # Convert the frame to RGB (OpenCV uses BGR by default)
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
                 # Resize the frame to fit the video frame dimensions
                 frame_resized = cv2.resize(frame, (window_width, window_height), interpolation=cv2.INTER_AREA)
 
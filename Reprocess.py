@@ -0,0 +1,297 @@
+import os
+import csv
+import time
+import bisect
+import argparse
+import datetime
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import cv2
+from Detection import MODEL_PATH, CSV_HEADER, d_width, d_height, detect, model_class_names
+from Retention import video_frame_step, video_scale
+
+# Frame rate CCTVApp declares for output_video.avi, only used to guess the frame step of old markers
+RECORD_FPS = 20.0
+
+# Largest frame gap between two logged detections that Time is interpolated across. Wider gaps may
+# span a camera stop/start, so their frames get an empty Time instead of a made-up one.
+MAX_TIME_GAP_FRAMES = 200
+
+# Model loaded once per worker process
+worker_model = None
+worker_class_names = None
+
+
+def init_worker(model_path, class_names):
+    global worker_model, worker_class_names
+
+    # One inference thread per worker, the parallelism comes from the processes
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    cv2.setNumThreads(1)
+
+    from ultralytics import YOLO
+    worker_model = YOLO(model_path)
+
+    # A retrained model can have a different class list, so read it from the weights by default
+    worker_class_names = class_names or model_class_names(worker_model)
+
+
+def read_segment(segment):
+    # Yield (recorded frame number, frame) for one segment, one frame in memory at a time
+    if segment["source"] == "video":
+        cap = cv2.VideoCapture(segment["path"])
+        cap.set(cv2.CAP_PROP_POS_FRAMES, segment["start"])
+        for k in range(segment["start"], segment["end"]):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            # A compacted video only keeps every step-th recorded frame
+            yield k * segment["step"], frame
+        cap.release()
+    else:
+        for n in segment["frames"]:
+            frame = cv2.imread(os.path.join(segment["path"], f"frame_{n}.jpg"))
+            if frame is not None:
+                yield n, frame
+
+
+def process_segment(segment):
+    start_cpu = time.process_time()
+    rows = []
+    frames = []
+    # Report coordinates in the recorded frame size whatever size the video was compacted to
+    scale_x, scale_y = segment["scale"]
+    for n, frame in read_segment(segment):
+        for label, x1, y1, x2, y2, confidence in detect(worker_model, frame, worker_class_names, verbose=False):
+            rows.append((n, label, int(round(x1 * scale_x)), int(round(y1 * scale_y)), confidence))
+        frames.append(n)
+    return segment["index"], rows, frames, time.process_time() - start_cpu
+
+
+def frame_numbers(frames_folder):
+    numbers = []
+    for filename in os.listdir(frames_folder):
+        name, ext = os.path.splitext(filename)
+        if ext.lower() != ".jpg":
+            continue
+        try:
+            numbers.append(int(name.split("_")[-1]))
+        except ValueError:
+            pass
+    return sorted(numbers)
+
+
+def make_segments(run_folder, segment_frames):
+    video_path = os.path.join(run_folder, "output_video.avi")
+    frames_folder = os.path.join(run_folder, "frames")
+    segments = []
+
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+    fps = (cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0) or RECORD_FPS
+    width = cap.get(cv2.CAP_PROP_FRAME_WIDTH) if cap.isOpened() else 0
+    height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT) if cap.isOpened() else 0
+    cap.release()
+
+    # Compaction may have shrunk the video, older markers don't record by how much so fall back
+    # to comparing the video size with the recorded d_width x d_height
+    scale = video_scale(run_folder)
+    if scale:
+        video_to_recorded = (1 / scale, 1 / scale)
+    elif width > 0 and height > 0:
+        video_to_recorded = (d_width / width, d_height / height)
+    else:
+        video_to_recorded = (1, 1)
+
+    # Retention may have kept only every step-th frame, older markers don't record it so
+    # fall back to comparing the video's frame rate with the recording rate
+    step = video_frame_step(run_folder)
+    if step is None:
+        step = max(1, round(RECORD_FPS / fps))
+
+    if total > 0:
+        for start in range(0, total, segment_frames):
+            segments.append({"index": len(segments), "source": "video", "path": video_path,
+                             "start": start, "end": min(start + segment_frames, total),
+                             "step": step, "scale": video_to_recorded})
+    elif os.path.isdir(frames_folder):
+        # No usable video, fall back to the frame dump
+        numbers = frame_numbers(frames_folder)
+        for i in range(0, len(numbers), segment_frames):
+            # Compaction only recompresses the frame dump, it keeps the recorded size
+            segments.append({"index": len(segments), "source": "frames", "path": frames_folder,
+                             "frames": numbers[i:i + segment_frames], "scale": (1, 1)})
+    return segments
+
+
+def read_frame_times(csv_path):
+    # Sorted frame numbers and their seconds from the Time column of the original CSV. The recording
+    # rate isn't fixed (one frame per YOLO loop) and the run folder time isn't when the camera
+    # started, so the logged times are the only reliable clock.
+    times = {}
+    if not os.path.exists(csv_path):
+        return [], []
+    with open(csv_path, newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            try:
+                n = int(row["Frame Count"])
+                clock = datetime.datetime.strptime(row["Time"], "%H:%M:%S")
+            except (KeyError, TypeError, ValueError):
+                continue
+            times.setdefault(n, clock.hour * 3600 + clock.minute * 60 + clock.second)
+
+    # Times are only HH:MM:SS, carry a day forward whenever the clock goes past midnight
+    frames = sorted(times)
+    seconds = []
+    day = 0
+    for n in frames:
+        if seconds and times[n] + day < seconds[-1]:
+            day += 86400
+        seconds.append(times[n] + day)
+    return frames, seconds
+
+
+def frame_time(frame_times, frame_number):
+    # Time of a frame interpolated between the nearest logged frames, empty if it can't be known
+    frames, times = frame_times
+    i = bisect.bisect_left(frames, frame_number)
+    if i < len(frames) and frames[i] == frame_number:
+        seconds = times[i]
+    elif 0 < i < len(frames) and frames[i] - frames[i - 1] <= MAX_TIME_GAP_FRAMES:
+        n0, n1 = frames[i - 1], frames[i]
+        t0, t1 = times[i - 1], times[i]
+        seconds = t0 + (t1 - t0) * (frame_number - n0) / (n1 - n0)
+    else:
+        return ""
+    seconds = int(round(seconds)) % 86400
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def read_detections(csv_path):
+    # Count detections per (frame, label) in a detection_results.csv
+    counts = Counter()
+    if not os.path.exists(csv_path):
+        return counts
+    with open(csv_path, newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            try:
+                counts[(int(row["Frame Count"]), row["Label"])] += 1
+            except (KeyError, TypeError, ValueError):
+                pass
+    return counts
+
+
+def write_diff_report(report_path, old_counts, new_counts, processed_frames):
+    # Only compare frames that were actually reprocessed, pruned frames are unknown
+    keys = {key for key in old_counts if key[0] in processed_frames} | set(new_counts)
+    gained = Counter()
+    lost = Counter()
+    with open(report_path, 'w', newline='') as csvfile:
+        csv_writer = csv.writer(csvfile)
+        csv_writer.writerow(["Frame Count", "Label", "Old", "New", "Change"])
+        for frame_number, label in sorted(keys):
+            old = old_counts[(frame_number, label)]
+            new = new_counts[(frame_number, label)]
+            if old == new:
+                continue
+            csv_writer.writerow([frame_number, label, old, new, new - old])
+            if new > old:
+                gained[label] += new - old
+            else:
+                lost[label] += old - new
+    return gained, lost
+
+
+def reprocess(run_folder, model_path=MODEL_PATH, class_names=None, workers=None, segment_frames=200):
+    workers = workers or os.cpu_count() or 1
+    segments = make_segments(run_folder, segment_frames)
+    if not segments:
+        print(f"No output_video.avi or frames found in {run_folder}")
+        return None
+
+    # More workers than segments would sit idle and skew the per-core throughput
+    workers = min(workers, len(segments))
+
+    model_name = os.path.splitext(os.path.basename(model_path))[0]
+    timestamp = datetime.datetime.now().strftime("%b_%d_%Y_%H_%M_%S")
+    csv_path = os.path.join(run_folder, f"detection_results_{model_name}_{timestamp}.csv")
+    report_path = os.path.join(run_folder, f"reprocess_diff_{model_name}_{timestamp}.csv")
+
+    results = {}
+    processed_frames = set()
+    cpu_seconds = 0.0
+    start_time = time.time()
+
+    # Keep at most two segments per worker in flight so memory stays bounded on long recordings
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(model_path, class_names)) as executor:
+        pending = set()
+        queued = iter(segments)
+        for segment in queued:
+            pending.add(executor.submit(process_segment, segment))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, rows, frames, cpu = future.result()
+                results[index] = rows
+                processed_frames.update(frames)
+                cpu_seconds += cpu
+                print(f"Segment {index + 1}/{len(segments)} done ({len(frames)} frames)")
+                segment = next(queued, None)
+                if segment is not None:
+                    pending.add(executor.submit(process_segment, segment))
+
+    elapsed = time.time() - start_time
+
+    # Write the new results in the same schema as CCTVApp, ordered by frame
+    old_csv_path = os.path.join(run_folder, "detection_results.csv")
+    frame_times = read_frame_times(old_csv_path)
+    new_counts = Counter()
+    with open(csv_path, 'w', newline='') as csvfile:
+        csv_writer = csv.writer(csvfile)
+        csv_writer.writerow(CSV_HEADER)
+        for index in sorted(results):
+            for frame_number, label, x1, y1, confidence in results[index]:
+                csv_writer.writerow([label, x1, y1, confidence, frame_time(frame_times, frame_number), frame_number])
+                new_counts[(frame_number, label)] += 1
+
+    old_counts = read_detections(old_csv_path)
+    gained, lost = write_diff_report(report_path, old_counts, new_counts, processed_frames)
+
+    frames_done = len(processed_frames)
+    fps = frames_done / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {frames_done} frames in {elapsed:.1f}s with {workers} workers")
+    print(f"Throughput: {fps:.2f} fps total, {fps / workers:.2f} fps per core")
+    if cpu_seconds > 0:
+        print(f"CPU throughput: {frames_done / cpu_seconds:.2f} frames per CPU second")
+    for label in sorted(set(gained) | set(lost)):
+        print(f"{label}: +{gained[label]} gained, -{lost[label]} lost")
+    print(f"Results saved to {csv_path}")
+    print(f"Diff report saved to {report_path}")
+
+    return {
+        "csv_path": csv_path,
+        "report_path": report_path,
+        "frames": frames_done,
+        "seconds": elapsed,
+        "fps_per_core": fps / workers,
+        "gained": gained,
+        "lost": lost,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-run a YOLO model over a recorded run folder")
+    parser.add_argument("run_folder", help="Run folder created by CCTVApp, e.g. ~/Documents/results_Yolov8/<timestamp>")
+    parser.add_argument("--model", default=MODEL_PATH, help="Path to the model weights")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: all cores)")
+    parser.add_argument("--segment-frames", type=int, default=200, help="Frames per segment")
+    args = parser.parse_args()
+
+    reprocess(os.path.expanduser(args.run_folder), args.model, None, args.workers, args.segment_frames)
@@ -0,0 +1,511 @@
+import os
+import csv
+import json
+import time
+import ctypes
+import shutil
+import datetime
+import threading
+from collections import deque
+import cv2
+
+# Folder name format used by CCTVApp.prepare_results_folder
+RUN_FOLDER_FORMAT = "%b_%d_%Y_%H_%M_%S"
+
+# Marker file written into a run folder once it has been compacted, JSON with the compaction time,
+# the video_frame_step applied to output_video.avi (video frame k is recorded frame k * step)
+# and the video_scale it was resized by (1 if the video was left as it was)
+COMPACTED_MARKER = ".compacted"
+
+# Name of the policy file and deletion log, both kept in the results folder
+CONFIG_FILE = "retention_config.json"
+LOG_FILE = "retention_log.txt"
+
+# Retention policy used when the config file doesn't set a value, the only place policy defaults live
+DEFAULT_CONFIG = {
+    "enabled": True,  # False keeps the disk usage display but never deletes or compacts anything
+    "max_age_days": 30,  # Runs older than this are deleted (null to disable)
+    "max_gb": None,  # Total size allowed for all run folders (null to disable)
+    "min_free_gb": 2,  # Oldest runs are deleted while the disk has less free space than this (null to disable)
+    "compact_after_hours": 24,  # Runs older than this get compacted
+    "keep_detection_frames_only": True,  # Compaction drops frames that are not near a detection
+    "frame_margin": 20,  # Frames kept before/after each detection
+    "jpeg_quality": 60,
+    "video_scale": 0.5,
+    "video_frame_step": 2,
+}
+
+# Settings that can be set to null to turn that rule off
+NULLABLE_SETTINGS = {"max_age_days", "max_gb", "min_free_gb"}
+
+# Windows SetThreadPriority value for background (low CPU and I/O priority) mode
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+
+
+def load_config(result_folder_path):
+    # Read the retention policy, writing a file with the defaults on first run so it can be edited
+    config_path = os.path.join(result_folder_path, CONFIG_FILE)
+    config = dict(DEFAULT_CONFIG)
+    if not os.path.exists(config_path):
+        with open(config_path, 'w') as f:
+            json.dump(DEFAULT_CONFIG, f, indent=4)
+        return config
+
+    try:
+        with open(config_path) as f:
+            loaded = json.load(f)
+    except (OSError, ValueError) as e:
+        # Never fall back to deleting with settings the user didn't choose
+        print(f"Error reading {config_path}, retention disabled: {e}")
+        config["enabled"] = False
+        return config
+
+    if not isinstance(loaded, dict):
+        print(f"Error reading {config_path}, retention disabled: expected a JSON object")
+        config["enabled"] = False
+        return config
+
+    for key, value in loaded.items():
+        if key not in DEFAULT_CONFIG:
+            print(f"Unknown retention setting ignored: {key}")
+        elif not valid_setting(key, value):
+            # A wrongly typed value like "enabled": "false" must not leave deletion running
+            print(f"Invalid value for {key} in {config_path}, retention disabled: {value!r}")
+            config["enabled"] = False
+            return config
+        else:
+            config[key] = value
+    return config
+
+
+def valid_setting(key, value):
+    # Check a value against the type of its DEFAULT_CONFIG entry
+    if value is None:
+        return key in NULLABLE_SETTINGS
+    default = DEFAULT_CONFIG[key]
+    if isinstance(default, bool):
+        return isinstance(value, bool)
+    # bool is a subclass of int, but true/false is never a sensible size or count
+    if isinstance(value, bool):
+        return False
+    # Compaction divides by these
+    if key in ("video_frame_step", "video_scale") and value <= 0:
+        return False
+    if isinstance(default, int):
+        return isinstance(value, int) and value >= 0
+    return isinstance(value, (int, float)) and value >= 0
+
+
+class RetentionManager:
+    def __init__(self, result_folder_path, check_interval=600, status_interval=60, io_pause=0.01, **policy):
+        self.result_folder_path = result_folder_path
+        self.log_path = os.path.join(result_folder_path, LOG_FILE)
+
+        # Retention policy, any setting not given falls back to DEFAULT_CONFIG
+        for key in policy:
+            if key not in DEFAULT_CONFIG:
+                raise TypeError(f"Unknown retention setting: {key}")
+        config = dict(DEFAULT_CONFIG, **policy)
+        self.enabled = config["enabled"]
+        self.max_bytes = config["max_gb"] * 1024 ** 3 if config["max_gb"] is not None else None
+        self.min_free_bytes = config["min_free_gb"] * 1024 ** 3 if config["min_free_gb"] is not None else None
+        self.max_age_days = config["max_age_days"]
+        self.compact_after_hours = config["compact_after_hours"]
+        self.keep_detection_frames_only = config["keep_detection_frames_only"]
+        self.frame_margin = config["frame_margin"]
+
+        # Compaction settings
+        self.jpeg_quality = config["jpeg_quality"]
+        self.video_scale = config["video_scale"]
+        self.video_frame_step = config["video_frame_step"]
+
+        # Background thread settings
+        self.check_interval = check_interval  # Seconds between retention passes
+        self.status_interval = status_interval  # Seconds between disk usage updates
+        self.io_pause = io_pause  # Sleep between file operations to keep disk I/O low priority
+
+        # Run folder that is currently being recorded, never touched
+        self.active_run_folder = None
+
+        # Sizes of finished run folders, so they are only walked again after they change
+        self.run_sizes = {}
+
+        # Free space samples used to forecast when the disk will be full
+        self.free_samples = deque(maxlen=60)
+
+        self.status = {}
+        self.running = False
+        self.thread = None
+        self.wake_event = threading.Event()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake_event.set()
+
+    def run(self):
+        self.lower_priority()
+        last_pass = None
+        while self.running:
+            try:
+                self.update_status()
+                if last_pass is None or time.time() - last_pass >= self.check_interval:
+                    self.enforce()
+                    last_pass = time.time()
+                    self.update_status()
+            except Exception as e:
+                print(f"Retention pass failed: {e}")
+            self.wake_event.wait(self.status_interval)
+            self.wake_event.clear()
+
+    def lower_priority(self):
+        # Only the retention thread is slowed down, the video loop keeps its normal priority
+        if os.name == 'nt':
+            # Background mode lowers both the CPU and the disk I/O priority of this thread
+            try:
+                kernel32 = ctypes.windll.kernel32
+                kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+            except (AttributeError, OSError):
+                pass
+            return
+
+        # On Linux the nice value applies per thread
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+
+    def pause(self):
+        if self.io_pause:
+            time.sleep(self.io_pause)
+
+    def list_runs(self):
+        # Return (age in seconds, path) for every run folder, oldest first. Only folders named by
+        # CCTVApp.prepare_results_folder are managed, anything else the user put here is left alone.
+        runs = []
+        if not os.path.isdir(self.result_folder_path):
+            return runs
+        now = datetime.datetime.now()
+        for name in os.listdir(self.result_folder_path):
+            path = os.path.join(self.result_folder_path, name)
+            if not os.path.isdir(path):
+                continue
+            try:
+                created = datetime.datetime.strptime(name, RUN_FOLDER_FORMAT)
+            except ValueError:
+                continue
+            runs.append(((now - created).total_seconds(), path))
+        runs.sort(reverse=True)
+        return runs
+
+    def is_active(self, path):
+        return self.active_run_folder is not None and \
+            os.path.abspath(path) == os.path.abspath(self.active_run_folder)
+
+    def folder_size(self, path):
+        # scandir reuses the directory listing's file sizes, so this avoids a stat per file on Windows
+        total = 0
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    total += self.folder_size(entry.path)
+                else:
+                    total += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                pass
+        return total
+
+    def run_size(self, path):
+        # The active run keeps growing, every other run is measured once and cached
+        if self.is_active(path):
+            return self.folder_size(path)
+        if path not in self.run_sizes:
+            self.run_sizes[path] = self.folder_size(path)
+        return self.run_sizes[path]
+
+    def results_size(self, runs=None):
+        if runs is None:
+            runs = self.list_runs()
+        paths = {path for age, path in runs}
+
+        # Forget runs that were removed outside of the retention manager
+        for path in list(self.run_sizes):
+            if path not in paths:
+                del self.run_sizes[path]
+        return sum(self.run_size(path) for path in paths)
+
+    def enforce(self):
+        if not self.enabled:
+            return
+        runs = [(age, path) for age, path in self.list_runs() if not self.is_active(path)]
+
+        # Delete runs past the maximum age
+        if self.max_age_days is not None:
+            for age, path in list(runs):
+                if age > self.max_age_days * 86400:
+                    self.delete_run(path, f"older than {self.max_age_days} days")
+                    runs.remove((age, path))
+
+        # Free space first, so a nearly full disk isn't made worse by compaction's temporary files
+        # and runs that are about to be deleted aren't compacted for nothing
+        self.enforce_budgets(runs)
+
+        # Compact old runs, one at a time, stopping if the disk runs low in between
+        for age, path in list(runs):
+            if not self.running:
+                return
+            if (age, path) not in runs or age <= self.compact_after_hours * 3600:
+                continue
+            if self.low_on_space():
+                self.enforce_budgets(runs)
+                if self.low_on_space():
+                    self.log("skipping compaction, not enough free space")
+                    return
+                if (age, path) not in runs:
+                    continue
+            self.compact_run(path)
+
+    def low_on_space(self):
+        return self.min_free_bytes is not None and \
+            shutil.disk_usage(self.result_folder_path).free < self.min_free_bytes
+
+    def enforce_budgets(self, runs):
+        # Delete the oldest runs in place from runs (oldest first) until the size and free space limits hold
+        if self.max_bytes is not None:
+            total = self.results_size()
+            for age, path in list(runs):
+                if total <= self.max_bytes:
+                    break
+                total -= self.delete_run(path, f"results over {self.max_bytes / 1024 ** 3:.1f} GB")
+                runs.remove((age, path))
+
+        # Delete the oldest runs while the disk is nearly full, whatever the size budget says
+        if self.min_free_bytes is not None:
+            for age, path in list(runs):
+                if not self.low_on_space():
+                    break
+                self.delete_run(path, f"less than {self.min_free_bytes / 1024 ** 3:.1f} GB free")
+                runs.remove((age, path))
+
+    def log(self, message):
+        print(f"Retention: {message}")
+        try:
+            with open(self.log_path, 'a') as f:
+                f.write(f"{datetime.datetime.now().isoformat(timespec='seconds')} {message}\n")
+        except OSError:
+            pass
+
+    def delete_run(self, path, reason):
+        # Return the number of bytes actually freed, measured again after deleting
+        size = self.run_size(path)
+        shutil.rmtree(path, ignore_errors=True)
+        self.run_sizes.pop(path, None)
+        remaining = self.folder_size(path) if os.path.exists(path) else 0
+        if remaining:
+            self.log(f"could not fully delete {path} ({reason}), {remaining} bytes left")
+        else:
+            self.log(f"deleted {path} ({reason}), {size} bytes")
+        return size - remaining
+
+    def compact_run(self, path):
+        marker = os.path.join(path, COMPACTED_MARKER)
+        if os.path.exists(marker):
+            return
+
+        frames_folder = os.path.join(path, "frames")
+        if os.path.isdir(frames_folder):
+            if self.keep_detection_frames_only:
+                self.prune_frames(path, frames_folder)
+            self.recompress_frames(frames_folder)
+
+        video_step, video_scale = 1, 1
+        video_path = os.path.join(path, "output_video.avi")
+        if os.path.exists(video_path):
+            video_step, video_scale = self.transcode_video(video_path)
+
+        # Only mark as done if we were not interrupted half way
+        if self.running:
+            with open(marker, 'w') as f:
+                json.dump({"compacted": datetime.datetime.now().isoformat(),
+                           "video_frame_step": video_step, "video_scale": video_scale}, f)
+            self.log(f"compacted {path}")
+
+        # Compaction changed the size, measure it again next time
+        self.run_sizes.pop(path, None)
+
+    def detection_frames(self, run_path):
+        # Frame numbers that had at least one detection, read from detection_results.csv
+        csv_path = os.path.join(run_path, "detection_results.csv")
+        frames = set()
+        if not os.path.exists(csv_path):
+            return frames
+        with open(csv_path, newline='') as csvfile:
+            for row in csv.DictReader(csvfile):
+                try:
+                    frames.add(int(row["Frame Count"]))
+                except (KeyError, TypeError, ValueError):
+                    pass
+        return frames
+
+    def frame_number(self, filename):
+        # frame_<n>.jpg -> n
+        try:
+            return int(os.path.splitext(filename)[0].split("_")[-1])
+        except ValueError:
+            return None
+
+    def prune_frames(self, run_path, frames_folder):
+        detected = self.detection_frames(run_path)
+        keep = set()
+        for n in detected:
+            keep.update(range(n - self.frame_margin, n + self.frame_margin + 1))
+
+        for filename in os.listdir(frames_folder):
+            if not self.running:
+                return
+            n = self.frame_number(filename)
+            if n is None or n in keep:
+                continue
+            try:
+                os.remove(os.path.join(frames_folder, filename))
+            except OSError as e:
+                print(f"Retention: could not remove {filename}: {e}")
+            self.pause()
+
+    def recompress_frames(self, frames_folder):
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        for filename in os.listdir(frames_folder):
+            if not self.running:
+                return
+            if not filename.lower().endswith(".jpg"):
+                continue
+            frame_path = os.path.join(frames_folder, filename)
+            frame = cv2.imread(frame_path)
+            if frame is None:
+                continue
+
+            # Write to a temporary file first so a full disk never leaves a broken frame behind
+            tmp_path = frame_path + ".tmp.jpg"
+            if cv2.imwrite(tmp_path, frame, params) and os.path.getsize(tmp_path) < os.path.getsize(frame_path):
+                os.replace(tmp_path, frame_path)
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self.pause()
+
+    def transcode_video(self, video_path):
+        # Return the (frame step, scale) the video on disk ends up with, (1, 1) if it was left as it was
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            return 1, 1
+        fps = cap.get(cv2.CAP_PROP_FPS) or 20.0
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) * self.video_scale)
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) * self.video_scale)
+        if width <= 0 or height <= 0:
+            cap.release()
+            return 1, 1
+
+        tmp_path = os.path.splitext(video_path)[0] + "_compact.avi"
+        fourcc = cv2.VideoWriter_fourcc(*'XVID')
+        writer = cv2.VideoWriter(tmp_path, fourcc, fps / self.video_frame_step, (width, height))
+
+        index = 0
+        completed = True
+        while True:
+            if not self.running:
+                completed = False
+                break
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % self.video_frame_step == 0:
+                writer.write(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA))
+            index += 1
+            if index % 100 == 0:
+                self.pause()
+
+        cap.release()
+        writer.release()
+
+        if completed and index > 0 and os.path.exists(tmp_path) and \
+                0 < os.path.getsize(tmp_path) < os.path.getsize(video_path):
+            os.replace(tmp_path, video_path)
+            return self.video_frame_step, self.video_scale
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return 1, 1
+
+    def update_status(self):
+        usage = shutil.disk_usage(self.result_folder_path)
+        now = time.time()
+        self.free_samples.append((now, usage.free))
+
+        # Estimate how fast free space is shrinking from the oldest and newest samples
+        seconds_left = None
+        first_time, first_free = self.free_samples[0]
+        if now > first_time and first_free > usage.free:
+            rate = (first_free - usage.free) / (now - first_time)
+            seconds_left = usage.free / rate
+
+        # Replace the dict in one assignment so the UI thread never sees a half-updated status
+        self.status = {
+            "total": usage.total,
+            "used": usage.used,
+            "free": usage.free,
+            "results": self.results_size(),
+            "seconds_left": seconds_left,
+        }
+
+    def status_text(self):
+        status = self.status
+        if not status:
+            return "Disk: checking..."
+        gb = 1024 ** 3
+        text = (f"Disk: {status['used'] / gb:.1f} / {status['total'] / gb:.1f} GB used, "
+                f"results {status['results'] / gb:.2f} GB")
+        if status["seconds_left"] is None:
+            text += "\nDisk full in: not filling"
+        else:
+            text += f"\nDisk full in: {format_duration(status['seconds_left'])}"
+        return text
+
+
+def format_duration(seconds):
+    days, rest = divmod(int(seconds), 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes = rest // 60
+    if days:
+        return f"{days}d {hours}h"
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m"
+
+
+def read_marker(run_path, key):
+    # Value stored in a run's compaction marker, None if the run has no readable marker or value
+    marker = os.path.join(run_path, COMPACTED_MARKER)
+    try:
+        with open(marker) as f:
+            return float(json.load(f)[key])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def video_frame_step(run_path):
+    # Recorded frames per frame of output_video.avi
+    step = read_marker(run_path, "video_frame_step")
+    return int(step) if step is not None else None
+
+
+def video_scale(run_path):
+    # Scale output_video.avi was resized by relative to the recorded frame size
+    return read_marker(run_path, "video_scale")